@@ -17,11 +17,15 @@ Endpoints:
 
 """
 
-from datetime import datetime, timedelta
-from math import floor
+import hashlib
+from datetime import datetime, timedelta, timezone
 
-from flask import Flask, request, jsonify
+import orjson
+from flask import Flask, Response, request, jsonify
+from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.orm import Session, object_session
 
 app = Flask(__name__)
 # Use a local sqlite file so it's easy for the reviewer to run it locally
@@ -29,19 +33,45 @@ app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///test.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
+# In-process cache for computed alerts (per company), cleared when stock or sales change
+cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache'})
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets reads run alongside writes; the rest trades durability/fsyncs for read speed,
+    # which is fine for this read-heavy sample app
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA mmap_size=268435456')  # 256 MB
+    cursor.execute('PRAGMA cache_size=-65536')  # 64 MB page cache
+    cursor.close()
+
+
+with app.app_context():
+    event.listen(db.engine, 'connect', set_sqlite_pragmas)
+
+
+def utcnow():
+    # Current UTC time as a naive datetime, matching how DateTime columns are stored,
+    # so the cutoff comparisons in SQL line up with the (product_id, created_at) index
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 
 # ---------- Models ----------
 class Company(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    warehouses = db.relationship('Warehouse', backref='company')
+    warehouses = db.relationship('Warehouse', back_populates='company')
 
 
 class Warehouse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     company_id = db.Column(db.Integer, db.ForeignKey('company.id'))
-    inventories = db.relationship('Inventory', backref='warehouse')
+    company = db.relationship('Company', back_populates='warehouses')
+    inventories = db.relationship('Inventory', back_populates='warehouse')
 
 
 class Supplier(db.Model):
@@ -57,22 +87,92 @@ class Product(db.Model):
     product_type = db.Column(db.String, nullable=False)  # e.g. 'fast-moving', 'slow-moving'
     supplier_id = db.Column(db.Integer, db.ForeignKey('supplier.id'))
     supplier = db.relationship('Supplier')
-    inventories = db.relationship('Inventory', backref='product')
-    sales = db.relationship('Sale', backref='product')
+    inventories = db.relationship('Inventory', back_populates='product')
+    sales = db.relationship('Sale', back_populates='product')
 
 
 class Inventory(db.Model):
+    # Company-scoped scans go by warehouse, then look up the product
+    __table_args__ = (
+        db.Index('ix_inv_wh_prod', 'warehouse_id', 'product_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
     warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'))
     quantity = db.Column(db.Integer, default=0)
+    product = db.relationship('Product', back_populates='inventories')
+    warehouse = db.relationship('Warehouse', back_populates='inventories')
 
 
 class Sale(db.Model):
+    # Recent sales lookups filter by product and date range
+    __table_args__ = (
+        db.Index('ix_sale_prod_ts', 'product_id', 'created_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
     quantity = db.Column(db.Integer, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=utcnow)
+    product = db.relationship('Product', back_populates='sales')
+
+
+# ---------- Cache invalidation ----------
+def alerts_cache_key(company_id):
+    return f'lowstock:{company_id}'
+
+
+def column_values(target, attr):
+    # Current value plus the previous one if it changed in this flush
+    # (e.g. an inventory row moved to another warehouse)
+    history = inspect(target).attrs[attr].history
+    return {getattr(target, attr), *history.deleted} - {None}
+
+
+def mark_companies_stale(target, company_ids):
+    # Mapper events run at flush time, before commit. Clearing the cache here would let a
+    # concurrent request re-cache the old committed data, so only record the ids for now.
+    session = object_session(target)
+    session.info.setdefault('stale_alert_companies', set()).update(company_ids)
+
+
+@event.listens_for(Inventory, 'after_insert')
+@event.listens_for(Inventory, 'after_update')
+@event.listens_for(Inventory, 'after_delete')
+def inventory_changed(mapper, connection, target):
+    # Inventory belongs to exactly one company via its warehouse
+    company_ids = connection.execute(
+        select(Warehouse.company_id)
+        .where(Warehouse.id.in_(column_values(target, 'warehouse_id')))
+    ).scalars()
+    mark_companies_stale(target, company_ids)
+
+
+@event.listens_for(Sale, 'after_insert')
+@event.listens_for(Sale, 'after_update')
+@event.listens_for(Sale, 'after_delete')
+def sale_changed(mapper, connection, target):
+    # A sale affects every company that stocks the product
+    company_ids = connection.execute(
+        select(Warehouse.company_id)
+        .join(Inventory, Inventory.warehouse_id == Warehouse.id)
+        .where(Inventory.product_id.in_(column_values(target, 'product_id')))
+        .distinct()
+    ).scalars()
+    mark_companies_stale(target, company_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def clear_stale_alerts(session):
+    for company_id in session.info.pop('stale_alert_companies', ()):
+        cache.delete(alerts_cache_key(company_id))
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_stale_alerts(session):
+    # Nothing was committed, so the cached alerts are still correct
+    session.info.pop('stale_alert_companies', None)
 
 
 # ---------- Business rules / configuration ----------
@@ -82,17 +182,23 @@ THRESHOLDS_BY_TYPE = {
     'normal': 20,
     'slow-moving': 5
 }
+# Fallback to a conservative threshold if type unknown
+DEFAULT_THRESHOLD = 10
+# Bound once so the per-alert lookup is a plain call: _threshold_for(product_type, DEFAULT_THRESHOLD)
+_threshold_for = THRESHOLDS_BY_TYPE.get
 
 # Only products with sales in the last SALES_LOOKBACK_DAYS are considered
 SALES_LOOKBACK_DAYS = 90
 # Average daily sales computed over this window (used to estimate days until stockout)
 SALES_AVG_DAYS = 30
+# How long (seconds) computed alerts are served from cache
+ALERTS_CACHE_TIMEOUT = 30
 
 
 # ---------- Helper functions ----------
-def get_threshold_for_product(product: Product):
-    # Fallback to a conservative threshold if type unknown
-    return THRESHOLDS_BY_TYPE.get(product.product_type, 10)
+def threshold_expression():
+    # SQL equivalent of _threshold_for, so the threshold check can run in the DB
+    return case(THRESHOLDS_BY_TYPE, value=Product.product_type, else_=DEFAULT_THRESHOLD)
 
 
 def get_recent_sales(product: Product, since: datetime):
@@ -101,6 +207,12 @@ def get_recent_sales(product: Product, since: datetime):
 
 # ---------- Endpoint ----------
 @app.route('/api/companies/<int:company_id>/alerts/low-stock', methods=['GET'])
+@cache.cached(
+    timeout=ALERTS_CACHE_TIMEOUT,
+    key_prefix=lambda: alerts_cache_key(request.view_args['company_id']),
+    # Don't cache the 404 tuple: creating a company doesn't invalidate anything
+    response_filter=lambda rv: not isinstance(rv, tuple)
+)
 def low_stock_alerts(company_id):
     """Return low stock alerts across all warehouses for the company.
 
@@ -109,80 +221,105 @@ def low_stock_alerts(company_id):
     - A product triggers an alert for a specific warehouse when that warehouse's inventory
       quantity is below the product threshold based on its type.
     - Supplier contact info is included when available.
+    - Results are cached per company for ALERTS_CACHE_TIMEOUT seconds and invalidated
+      whenever inventory or sales rows change.
     - days_until_stockout is estimated as floor(current_stock / avg_daily_sales).
       If avg_daily_sales == 0 (shouldn't happen because we require recent sales), we return null.
+      This is computed in integers as current_stock * SALES_AVG_DAYS // total_sold_in_window.
     """
 
-    company = Company.query.get(company_id)
-    if not company:
+    # Only the id column is fetched; no Company object is built
+    if db.session.query(Company.id).filter_by(id=company_id).scalar() is None:
         return jsonify({'error': 'Company not found'}), 404
 
-    now = datetime.utcnow()
+    now = utcnow()
     lookback_cutoff = now - timedelta(days=SALES_LOOKBACK_DAYS)
     avg_sales_cutoff = now - timedelta(days=SALES_AVG_DAYS)
 
-    alerts = []
-
-    # Iterate over all products available in the company's warehouses
-    # To keep it simple, collect unique products referenced by inventories in these warehouses
-    warehouse_ids = [w.id for w in company.warehouses]
-    inventories = Inventory.query.filter(Inventory.warehouse_id.in_(warehouse_ids)).all()
-
-    # Map product_id -> list of inventories (per warehouse)
-    prod_inv_map = {}
-    for inv in inventories:
-        prod_inv_map.setdefault(inv.product_id, []).append(inv)
-
-    for product_id, inv_list in prod_inv_map.items():
-        product = Product.query.get(product_id)
-        # Check recent sales activity for the product
-        recent_sales = [s for s in product.sales if s.created_at >= lookback_cutoff]
-        if not recent_sales:
+    # Units sold per product over SALES_AVG_DAYS, summed by the DB
+    sales_totals = (
+        select(Sale.product_id, func.sum(Sale.quantity).label('total'))
+        .where(Sale.created_at >= avg_sales_cutoff)
+        .group_by(Sale.product_id)
+        .subquery()
+    )
+
+    # One query for everything: the company's inventories that are below threshold,
+    # for products with recent sales, along with warehouse, supplier and sales totals.
+    # Only plain columns are selected, so rows come back as lightweight Row tuples
+    # with no ORM objects, identity map bookkeeping or lazy loads involved.
+    stmt = (
+        select(
+            Product.id.label('product_id'),
+            Product.name.label('product_name'),
+            Product.sku,
+            Product.product_type,
+            Warehouse.id.label('warehouse_id'),
+            Warehouse.name.label('warehouse_name'),
+            Inventory.quantity.label('current_stock'),
+            Supplier.id.label('supplier_id'),
+            Supplier.name.label('supplier_name'),
+            Supplier.contact_email.label('supplier_email'),
+            sales_totals.c.total.label('total_sold_in_window')
+        )
+        .select_from(Warehouse)
+        .join(Inventory, Inventory.warehouse_id == Warehouse.id)
+        .join(Product, Product.id == Inventory.product_id)
+        .outerjoin(Supplier, Supplier.id == Product.supplier_id)
+        .outerjoin(sales_totals, sales_totals.c.product_id == Product.id)
+        .where(
+            Warehouse.company_id == company_id,
+            Inventory.quantity < threshold_expression(),
             # Business rule: only alert for products with recent sales activity
-            continue
-
-        threshold = get_threshold_for_product(product)
-
-        # Compute average daily sales over SALES_AVG_DAYS (for the product across company)
-        sales_for_avg = [s for s in product.sales if s.created_at >= avg_sales_cutoff]
-        total_sold_in_window = sum(s.quantity for s in sales_for_avg)
-        avg_daily_sales = total_sold_in_window / SALES_AVG_DAYS if SALES_AVG_DAYS > 0 else 0
-
-        for inv in inv_list:
-            current_stock = inv.quantity
-            if current_stock < threshold:
-                # Estimate days until stockout (None if we can't estimate)
-                days_until_stockout = None
-                if avg_daily_sales > 0:
-                    days_until_stockout = floor(current_stock / avg_daily_sales)
-
-                supplier = product.supplier
-                supplier_obj = None
-                if supplier:
-                    supplier_obj = {
-                        'id': supplier.id,
-                        'name': supplier.name,
-                        'contact_email': supplier.contact_email
-                    }
-
-                alerts.append({
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'sku': product.sku,
-                    'warehouse_id': inv.warehouse.id,
-                    'warehouse_name': inv.warehouse.name,
-                    'current_stock': current_stock,
-                    'threshold': threshold,
-                    'days_until_stockout': days_until_stockout,
-                    'supplier': supplier_obj
-                })
+            Product.sales.any(Sale.created_at >= lookback_cutoff)
+        )
+        .order_by(Product.id, Inventory.id)
+    )
+
+    # days_until_stockout: average daily sales is total_sold_in_window / SALES_AVG_DAYS,
+    # multiplied through to stay in integers (None if we can't estimate)
+    alerts = [
+        {
+            'product_id': r.product_id,
+            'product_name': r.product_name,
+            'sku': r.sku,
+            'warehouse_id': r.warehouse_id,
+            'warehouse_name': r.warehouse_name,
+            'current_stock': r.current_stock,
+            'threshold': _threshold_for(r.product_type, DEFAULT_THRESHOLD),
+            'days_until_stockout': (
+                r.current_stock * SALES_AVG_DAYS // r.total_sold_in_window
+                if (r.total_sold_in_window or 0) > 0 and SALES_AVG_DAYS > 0 else None
+            ),
+            'supplier': {
+                'id': r.supplier_id,
+                'name': r.supplier_name,
+                'contact_email': r.supplier_email
+            } if r.supplier_id is not None else None
+        }
+        for r in db.session.execute(stmt)
+    ]
 
     response = {
         'alerts': alerts,
         'total_alerts': len(alerts)
     }
 
-    return jsonify(response), 200
+    # ETag lets polling clients skip the body when nothing changed (see conditional_get)
+    body = orjson.dumps(response)
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    resp = Response(body, status=200, mimetype='application/json')
+    resp.set_etag(etag)
+    return resp
+
+
+@app.after_request
+def conditional_get(response):
+    # Done here rather than in the view so it also applies to cached responses:
+    # a matching If-None-Match turns the response into an empty 304
+    if 'ETag' in response.headers:
+        response.make_conditional(request)
+    return response
 
 
 # ---------- Simple DB seeder for demonstration and manual testing ----------
@@ -216,7 +353,7 @@ def seed_sample_data():
     db.session.commit()
 
     # Sales - p1 has recent sales, p2 has older sales only
-    now = datetime.utcnow()
+    now = utcnow()
     recent_sale_p1 = Sale(product_id=p1.id, quantity=10, created_at=now - timedelta(days=5))
     old_sale_p2 = Sale(product_id=p2.id, quantity=100, created_at=now - timedelta(days=200))
     recent_sale_p2 = Sale(product_id=p2.id, quantity=60, created_at=now - timedelta(days=10))